@@ -1,20 +1,75 @@
+import os
 import pretty_midi
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 from pathlib import Path
-import bisect
 
 # --- 1. Define file paths ---
-BASE_DIR = Path(__file__).resolve().parent.parent
+BASE_DIR = Path(__file__).absolute().parent.parent
 RAW_DATA_DIR = BASE_DIR / "data" / "raw"
 PROCESSED_DATA_DIR = BASE_DIR / "data" / "processed"
 
+MIDI_EXTENSIONS = {".mid", ".midi"}
+
+# Set to True to save the notes as CSV instead of Parquet
+SAVE_AS_CSV = False
+
+def _split_note_name(note_name):
+    """
+    Splits a note name such as 'E5' into the simple note ('E') and the octave (5).
+    """
+    # The lowest MIDI octave is written with a minus sign, e.g. 'C-1'
+    if note_name.endswith("-1"):
+        return note_name[:-2], -1
+
+    # Otherwise the octave is the last character
+    if note_name[-1].isdigit():
+        return note_name[:-1], int(note_name[-1])
+
+    # In case a note name has no octave, set it to None
+    return note_name, None
+
+# Layout of the per-instrument array of note attributes
+_NOTE_DTYPE = np.dtype([
+    ("pitch", np.int8),
+    ("start", np.float64),
+    ("end", np.float64),
+    ("velocity", np.int8),
+])
+
+# --- 2. Build lookup tables ---
+# MIDI pitches and programs are both 0-127, so every name we need
+# can be computed once here instead of once per note.
+_PITCH_NAMES = [pretty_midi.note_number_to_name(pitch) for pitch in range(128)]
+_PITCH_SPLITS = [_split_note_name(name) for name in _PITCH_NAMES]
+
+# The pitch tables are typed pandas arrays, so .take(pitches) expands them
+# to one value per note on integer codes without creating Python objects.
+_PITCH_TO_NAME = pd.Categorical(_PITCH_NAMES)
+_PITCH_TO_SIMPLE = pd.Categorical([simple for simple, _ in _PITCH_SPLITS])
+_PITCH_TO_OCTAVE = pd.array([octave for _, octave in _PITCH_SPLITS], dtype="Int8")
+_PROGRAM_TO_NAME = tuple(
+    pretty_midi.program_to_instrument_name(program) for program in range(128)
+)
+
 def find_midi_file(search_dir):
     """
     Searches a directory for exactly one MIDI file.
     """
     print(f"Searching for MIDI files in: {search_dir}")
 
-    midi_files = list(search_dir.glob("*.mid*"))
+    # Search for .mid or .midi in a single pass over the directory
+    # A missing directory counts as no files found
+    try:
+        with os.scandir(search_dir) as entries:
+            midi_files = [
+                Path(entry.path) for entry in entries
+                if entry.is_file() and os.path.splitext(entry.name)[1].lower() in MIDI_EXTENSIONS
+            ]
+    except FileNotFoundError:
+        midi_files = []
 
     if len(midi_files) == 0:
         print("\n--- ERROR ---")
@@ -33,61 +88,85 @@ def find_midi_file(search_dir):
     
 def extract_note_data(midi_data, beat_times, measure_times):
     """
-    Loops through all instruments and notes, returning a list of dictionaries.
+    Loops through all instruments, collecting note arrays per instrument,
+    and returns the notes of every track as a single DataFrame.
     """
-    all_notes = []
-
-    print(f"Processing {len(midi_data.instruments)} instrument tracks...")
-
-    for i, instrument in enumerate(midi_data.instruments):
-
-        # Get the instrument name
-        instrument_name = pretty_midi.program_to_instrument_name(instrument.program)
-
-        # Loop over all notes for this instrument
-        for note in instrument.notes:
-            
-            note_name = pretty_midi.note_number_to_name(note.pitch)
-            
-            # Find the insert point for the not's start time in our "rulers"
-            # bisect_right gives us the index of the bucket the note falls into
-            measure_num = bisect.bisect_right(measure_times, note.start)
-            beat_num = bisect.bisect_right(beat_times, note.start)
-
-            # Slice note_name to split 'E5' to note and octave
-            # 1. Get the simple note. This is everything except the last character
-            note_simple = note_name[:-1]
-
-            # 2. Get the octave. This is only the last character.
-            # Cast it into an integer.
-            try:
-                octave = int(note_name[-1])
-            except ValueError:
-                # In case a note name is not valid (e.g., for drums),
-                # set the octave to None
-                octave = None
-
-            note_data = {
-                "track_index": i,
-                "track_name": instrument.name,
-                "instrument": instrument_name,
-                "is_drum": instrument.is_drum,
-                "pitch_num": note.pitch,
-                "note_name": note_name,
-                "note_simple": note_simple,
-                "octave": octave,
-                "measure_num": measure_num,
-                "beat_num": beat_num,
-                "start_time_sec": note.start,
-                "end_time_sec": note.end,
-                "duration_sec": note.duration,
-                "velocity": note.velocity
-            }
-
-            # Add this note's data to our list
-            all_notes.append(note_data)
-    print(f"Successfully extracted {len(all_notes)} total notes")
-    return all_notes
+    track_index_list = []
+    pitch_list = []
+    start_list = []
+    end_list = []
+    velocity_list = []
+
+    # Per-track values, looked up by track index once all notes are gathered
+    track_names = []
+    instrument_names = []
+    track_is_drum = []
+
+    instruments = midi_data.instruments
+    print(f"Processing {len(instruments)} instrument tracks...")
+
+    for i, instrument in enumerate(instruments):
+        notes = instrument.notes
+        num_notes = len(notes)
+
+        # Instrument-level values are read once here, never per note
+        track_names.append(instrument.name)
+        instrument_names.append(_PROGRAM_TO_NAME[instrument.program])
+        track_is_drum.append(bool(instrument.is_drum))
+
+        # Read every note's attributes in a single pass into a structured
+        # array, then keep one array per field from here on
+        note_array = np.array(
+            [(note.pitch, note.start, note.end, note.velocity) for note in notes],
+            dtype=_NOTE_DTYPE,
+        )
+        track_index_list.append(np.full(num_notes, i, dtype=np.int16))
+        pitch_list.append(note_array["pitch"])
+        start_list.append(note_array["start"])
+        end_list.append(note_array["end"])
+        velocity_list.append(note_array["velocity"])
+
+    if not track_index_list:
+        return pd.DataFrame()
+
+    track_index = np.concatenate(track_index_list)
+    pitches = np.concatenate(pitch_list)
+    starts = np.concatenate(start_list)
+    ends = np.concatenate(end_list)
+    is_drum = np.take(np.array(track_is_drum, dtype=bool), track_index)
+
+    # Drum pitches are percussion sounds, not notes, so they get no note
+    # name or octave. -1 makes the lookups below fill in a missing value.
+    name_codes = np.where(is_drum, -1, pitches)
+
+    # Find the bucket each note's start time falls into on our "rulers",
+    # for all notes at once. side="right" gives the index of the bucket.
+    measure_nums = np.searchsorted(np.asarray(measure_times), starts, side="right")
+    beat_nums = np.searchsorted(np.asarray(beat_times), starts, side="right")
+
+    # Build the DataFrame straight from typed columns, so pandas
+    # does not have to infer a dtype for each one
+    columns = {
+        "track_index": track_index,
+        # Categorical.take only repeats the small integer codes per note
+        "track_name": pd.Categorical(track_names).take(track_index),
+        "instrument": pd.Categorical(instrument_names).take(track_index),
+        "is_drum": is_drum,
+        "pitch_num": pitches,
+        "note_name": _PITCH_TO_NAME.take(name_codes, allow_fill=True),
+        "note_simple": _PITCH_TO_SIMPLE.take(name_codes, allow_fill=True),
+        "octave": _PITCH_TO_OCTAVE.take(name_codes, allow_fill=True),
+        "measure_num": measure_nums.astype(np.int32),
+        "beat_num": beat_nums.astype(np.int32),
+        "start_time_sec": starts,
+        "end_time_sec": ends,
+        "duration_sec": ends - starts,
+        "velocity": np.concatenate(velocity_list),
+    }
+    df = pd.DataFrame(columns, copy=False)
+
+    print(f"Successfully extracted {len(df)} total notes")
+    return df
 
 def save_data_to_csv(df, output_dir, file_name):
     """
@@ -103,8 +182,30 @@ def save_data_to_csv(df, output_dir, file_name):
     output_path = output_dir / file_name
     
     # 3. Save the DataFrame to CSV
-    # Use index=False to avoid extra column added by pandas with row numbers
-    df.to_csv(output_path, index=False)
+    # Convert to an Arrow table (without the pandas row numbers) so the CSV
+    # is written column by column in C++ rather than row by row in Python
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pacsv.write_csv(table, output_path, write_options=pacsv.WriteOptions(include_header=True))
+
+    print("--- Success! ---")
+    print(f"Data saved to: {output_path}")
+
+def save_data_to_parquet(df, output_dir, name):
+    """
+    Saves a DataFrame to a zstd-compressed Parquet file in a specified directory.
+    """
+    print("\n--- Saving DataFrame to Parquet ---")
+
+    # 1. Ensure the output directory exists
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # 2. Define the full path for the file
+    output_path = output_dir / f"{name}.parquet"
+
+    # 3. Save the DataFrame to Parquet
+    # Columns keep their dtypes, so categoricals are dictionary-encoded
+    # and numbers are stored as binary instead of text
+    df.to_parquet(output_path, engine="pyarrow", compression="zstd", index=False)
 
     print("--- Success! ---")
     print(f"Data saved to: {output_path}")
@@ -136,16 +237,16 @@ def main():
             print(f"First 5 beat times (in seconds): {beat_times[0:5]}")
             print(f"First 5 measure times (in seconds): {measure_times[0:5]}")
                         
-            all_note_data = extract_note_data(midi_data, beat_times, measure_times)
-
-            if all_note_data:
-                # 1. Convert list to DataFrame
-                df = pd.DataFrame(all_note_data)
+            df = extract_note_data(midi_data, beat_times, measure_times)
 
-                # 2. Call the new save function
-                save_data_to_csv(df, PROCESSED_DATA_DIR, "rhcp_dosed_notes.csv")
+            if not df.empty:
+                # 1. Call the new save function
+                if SAVE_AS_CSV:
+                    save_data_to_csv(df, PROCESSED_DATA_DIR, "rhcp_dosed_notes.csv")
+                else:
+                    save_data_to_parquet(df, PROCESSED_DATA_DIR, "rhcp_dosed_notes")
 
-                # 3. Print .head()
+                # 2. Print .head()
                 print("Final .head() preview:")
                 print(df.head())
 
@@ -1,6 +1,10 @@
+import os
 from pathlib import Path
 import music21 as m21
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
 
 
 # Add dictionaries to enrich data
@@ -32,20 +36,47 @@ ARTIST_MAP = {
 }
 
 
-BASE_DIR = Path(__file__).resolve().parent.parent
+BASE_DIR = Path(__file__).absolute().parent.parent
 RAW_DATA_DIR = BASE_DIR / "data" / "raw"
 PROCESSED_DATA_DIR = BASE_DIR / "data" / "processed"
 
+MUSICXML_EXTENSIONS = {".musicxml", ".mxl", ".xml"}
+
+# Column types of the Parquet output, written one part at a time
+PARQUET_SCHEMA = pa.schema([
+    ("part_index", pa.int16()),
+    ("part_name", pa.string()),
+    ("type", pa.string()),
+    ("pitch_num", pa.int16()),
+    ("pitch_name", pa.string()),
+    ("pitch_simple", pa.string()),
+    ("octave", pa.int8()),
+    ("beat", pa.float64()),
+    ("duration_beats", pa.float64()),
+    ("offset_beats", pa.float64()),
+    ("instrument_en", pa.string()),
+    ("artist", pa.string()),
+])
+
+# Set to True to save the notes as CSV instead of Parquet
+SAVE_AS_CSV = False
+
 def  find_musicxml_file(search_dir):
     """
     Searches a directory for exactly one MusicXML file.
     """
     print(f"Searching for MusicXML files in: {search_dir}")
 
-    # Search for .musicxml Or .xml
-    xml_files = list(search_dir.glob("*.musicxml"))
-    xml_files.extend(list(search_dir.glob("*.mxl"))) # Append .mxl to list
-    xml_files.extend(list(search_dir.glob("*.xml"))) # Append .xml to list
+    # Search for .musicxml, .mxl or .xml in a single pass over the directory
+    # A missing directory counts as no files found
+    try:
+        with os.scandir(search_dir) as entries:
+            xml_files = [
+                Path(entry.path) for entry in entries
+                if entry.is_file() and os.path.splitext(entry.name)[1].lower() in MUSICXML_EXTENSIONS
+            ]
+    except FileNotFoundError:
+        xml_files = []
 
     if len(xml_files) == 0:
         print("\n--- ERROR ---")
@@ -62,103 +93,147 @@ def  find_musicxml_file(search_dir):
         print(f"Found one file: {file_to_load.name}")
         return file_to_load
 
+def extract_part_data(part, i):
+    """
+    Loops through one part of the score and extracts its data as a
+    dictionary of columns.
+    """
+    # One list per column, all appended to in step for every row
+    types = []
+    pitch_nums = []
+    pitch_names = []
+    pitch_simples = []
+    octaves = []
+    beats = []
+    durations = []
+    offsets = []
+
+    # Bind the append methods once, outside the loop
+    add_type = types.append
+    add_pitch_num = pitch_nums.append
+    add_pitch_name = pitch_names.append
+    add_pitch_simple = pitch_simples.append
+    add_octave = octaves.append
+    add_beat = beats.append
+    add_duration = durations.append
+    add_offset = offsets.append
+
+    # Bind the item classes once so each item is dispatched on its exact type
+    Note = m21.note.Note
+    Chord = m21.chord.Chord
+    Unpitched = m21.note.Unpitched
+    PercussionChord = m21.percussion.PercussionChord
+    item_types = (Note, Chord, Unpitched, PercussionChord)
+
+    # Walk the part's measures lazily, only yielding notes and chords,
+    # instead of copying every element into a flat stream first
+    all_items = part.recurse().getElementsByClass(item_types)
+
+    # Iterate over each item (note/chord)
+    for item in all_items:
+        cls = type(item)
+
+        # Skip subclasses such as chord symbols
+        if cls not in item_types:
+            continue
+
+        # Read the values shared by every row of this item only once,
+        # casting music21's Fractions (e.g. triplets) to floats right away;
+        # pd.to_numeric would turn them into NaN
+        beat = float(item.beat)
+        duration_beats = float(item.duration.quarterLength)
+        # item.offset is relative to its measure, so ask the iterator
+        # for the offset from the start of the part
+        offset_beats = float(all_items.currentHierarchyOffset())
+
+        # Case 1: the item is a single note
+        if cls is Note:
+            note_type = "Note"
+            pitches = (item.pitch,)
+
+        # Case 2: the item is a chord
+        # Case 4: the item is a drum chord
+        # Add a separate row for each note in the chord.
+        elif cls is Chord or cls is PercussionChord:
+            note_type = "Chord Note" if cls is Chord else "Drum Chord Hit"
+            pitches = item.pitches
+
+        # Case 3: the item is a single drum hit
+        else:
+            try:
+                p = m21.pitch.Pitch(item.displayStep + str(item.displayOctave))
+                pitch_num = p.midi
+                pitch_name = p.nameWithOctave
+                pitch_simple = p.name
+                octave = p.octave
+            except Exception:
+                pitch_num = None
+                pitch_name = item.displayName or "Drum"
+                pitch_simple = item.displayName or "Drum"
+                octave = None
+            add_type("Drum Hit")
+            add_pitch_num(pitch_num)
+            add_pitch_name(pitch_name)
+            add_pitch_simple(pitch_simple)
+            add_octave(octave)
+            add_beat(beat)
+            add_duration(duration_beats)
+            add_offset(offset_beats)
+            continue
+
+        for pitch in pitches:
+            add_type(note_type)
+            add_pitch_num(pitch.midi)
+            add_pitch_name(pitch.nameWithOctave)
+            add_pitch_simple(pitch.name)
+            add_octave(pitch.octave)
+            add_beat(beat)
+            add_duration(duration_beats)
+            add_offset(offset_beats)
+
+    # The part columns are the same for every row
+    num_rows = len(types)
+    part_name = part.partName
+    return {
+        "part_index": [i] * num_rows,
+        "part_name": [part_name] * num_rows,
+        "type": types,
+        "pitch_num": pitch_nums,
+        "pitch_name": pitch_names,
+        "pitch_simple": pitch_simples,
+        "octave": octaves,
+        "beat": beats,
+        "duration_beats": durations,
+        "offset_beats": offsets,
+        # Enrich the part with its English instrument name and artist
+        "instrument_en": [INSTRUMENT_MAP.get(part_name)] * num_rows,
+        "artist": [ARTIST_MAP.get(part_name)] * num_rows,
+    }
+
+def iter_part_data(score):
+    """
+    Yields the columns of each part in score order.
+    """
+    parts = score.parts
+    num_parts = len(parts)
+
+    for i, part in enumerate(parts):
+        print(f"    - Processing Part {i +1}/{num_parts}: {part.partName}")
+        yield extract_part_data(part, i)
+
 def extract_musicxml_data(score):
     """
-    Loops through all parts in the score and extracts data.
+    Extracts data from all parts in the score.
     """
     print("\n--- Extracting Data from All Parts ---")
 
-    # Empty list to hold the list of dictionaries
-    all_data = []
-
-    # Outer loop - iterate over each instrument part
-    for i, part in enumerate(score.parts):
-        print(f"    - Processing Part {i +1}/{len(score.parts)}: {part.partName}")
-
-        # Get all notes, chords, and rests from the iterated part
-        all_items = part.flatten().notesAndRests
-
-        # Iterate over each item (note/chord/rest)
-        for item in all_items:
-
-            # Case 1: the item is a single note
-            if isinstance(item, m21.note.Note):
-                note_data = {
-                    "part_index": i,
-                    "part_name": part.partName,
-                    "type": "Note",
-                    "pitch_num": item.pitch.midi,
-                    "pitch_name": item.nameWithOctave,
-                    "pitch_simple": item.pitch.name,
-                    "octave": item.pitch.octave,
-                    "beat": item.beat,
-                    "duration_beats": item.duration.quarterLength,
-                    "offset_beats": item.offset,
-                }
-                all_data.append(note_data)
-            
-            # Case 2: the item is a chord
-            elif isinstance(item, m21.chord.Chord):
-                # Loop through each note and add a separate row for each note in the chord.
-                for pitch in item.pitches:
-                    note_data = {
-                        "part_index": i,
-                        "part_name": part.partName,
-                        "type": "Chord Note",
-                        "pitch_num": pitch.midi,
-                        "pitch_name": pitch.nameWithOctave,
-                        "pitch_simple": pitch.name,
-                        "octave": pitch.octave,
-                        "beat": item.beat,
-                        "duration_beats": item.duration.quarterLength,
-                        "offset_beats": item.offset,
-                    }
-                    all_data.append(note_data)
-            # Case 3: the item is a single drum hit
-            elif isinstance(item, m21.note.Unpitched):
-                try:
-                    p = m21.pitch.Pitch(item.displayStep + str(item.displayOctave))
-                    pitch_num = p.midi
-                    pitch_name = p.nameWithOctave
-                    pitch_simple = p.name
-                    octave = p.octave
-                except Exception:
-                    pitch_num = None
-                    pitch_name = item.displayName or "Drum"
-                    pitch_simple = item.displayName or "Drum"
-                    octave = None
-                note_data = {
-                    "part_index": i,
-                    "part_name": part.partName,
-                    "type": "Drum Hit",
-                    "pitch_num": pitch_num,
-                    "pitch_name": pitch_name,
-                    "pitch_simple": pitch_simple,
-                    "octave": octave,
-                    "beat": item.beat,
-                    "duration_beats": item.duration.quarterLength,
-                    "offset_beats": item.offset,
-                }
-                all_data.append(note_data)      
-
-            # Case 4: the item is a drum chord
-            elif isinstance(item, m21.percussion.PercussionChord):
-                for pitch in item.pitches:
-                    note_data = {
-                        "part_index": i,
-                        "part_name": part.partName,
-                        "type": "Drum Chord Hit",
-                        "pitch_num": pitch.midi,
-                        "pitch_name": pitch.nameWithOctave,
-                        "pitch_simple": pitch.name,
-                        "octave": pitch.octave,
-                        "beat": item.beat,
-                        "duration_beats": item.duration.quarterLength,
-                        "offset_beats": item.offset,
-                    }                   
-
-
-    print(f"--- Finished processing. Found {len(all_data)} total notes. ---")
+    # Join each column across the parts
+    all_data = {}
+    for columns in iter_part_data(score):
+        for col, values in columns.items():
+            all_data.setdefault(col, []).extend(values)
+
+    print(f"--- Finished processing. Found {len(all_data.get('type', []))} total notes. ---")
     return all_data
 
 def clean_dataframe(df):
@@ -170,14 +245,12 @@ def clean_dataframe(df):
     # Define columns that should be numbers
     numeric_cols = ["beat", "duration_beats", "offset_beats"]
 
-    for col in numeric_cols:
-        df[col] = pd.to_numeric(df[col], errors="coerce")
-    
-    # Create the new instrument_en column by mapping part_name
-    df["instrument_en"] = df["part_name"].map(INSTRUMENT_MAP)
+    # These are already floats from extraction; coerce them all in one
+    # assignment as a safeguard instead of one assignment per column
+    df[numeric_cols] = df[numeric_cols].apply(pd.to_numeric, errors="coerce")
 
-    # Create the new artist column by mapping part_name
-    df["artist"] = df["part_name"].map(ARTIST_MAP)
+    # instrument_en and artist are already filled in per part by
+    # extract_part_data, so CSV and Parquet output share one mapping
 
     print(f"DataFrame successfully cleaned.")
     return df
@@ -194,12 +267,47 @@ def save_data_to_csv(df, output_dir, file_name):
     # Define the full path for the file
     output_path = output_dir / file_name
 
-    # Save the df to CSV
-    df.to_csv(output_path, index=False)
+    # Save the df to CSV through Arrow's column-wise C++ writer
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    pacsv.write_csv(table, output_path, write_options=pacsv.WriteOptions(include_header=True))
 
     print("--- Success! ---")
     print(f"Clean data saved to: {output_path}")
 
+def save_parts_to_parquet(score, output_dir, name):
+    """
+    Extracts each part of the score and appends it to a zstd-compressed
+    Parquet file as soon as it is ready, so the rows of the whole score are
+    never held in memory together.
+    """
+    print("\n--- Extracting Data from All Parts to Parquet ---")
+
+    # Ensure the directory exists
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    # Define the full path for the file
+    output_path = output_dir / f"{name}.parquet"
+
+    # Write to a temporary file next to it and only move it into place once
+    # every part is written, so a failure never leaves a partial file behind
+    temp_path = output_dir / f".{name}.parquet.tmp"
+
+    num_rows = 0
+    try:
+        with pq.ParquetWriter(temp_path, PARQUET_SCHEMA, compression="zstd") as writer:
+            for columns in iter_part_data(score):
+                writer.write_batch(pa.RecordBatch.from_pydict(columns, schema=PARQUET_SCHEMA))
+                num_rows += len(columns["type"])
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+    os.replace(temp_path, output_path)
+
+    print("--- Success! ---")
+    print(f"Wrote {num_rows} total notes to: {output_path}")
+    return output_path
+
 def main():
     """
     Main function to run the script.
@@ -217,9 +325,24 @@ def main():
             print("\n--- Success! ---")
             print("File loaded and parsed successfully.")
 
+            # Parquet is written part by part, without building a DataFrame
+            if not SAVE_AS_CSV:
+                output_path = save_parts_to_parquet(score, PROCESSED_DATA_DIR, "rhcp-dosed_musicmxl_notes")
+
+                print("\n--- Pipeline Complete ---")
+                print("Final DataFrame .head() preview:")
+                # Read back only the first rows instead of the whole file
+                first_rows = next(pq.ParquetFile(output_path).iter_batches(batch_size=5), None)
+                if first_rows is not None:
+                    print(first_rows.to_pandas())
+
+                print(pd.read_parquet(output_path, filters=[("part_name", "==", "Batería")]))
+                return
+
             all_note_data = extract_musicxml_data(score)
 
-            if all_note_data:
+            # Only continue if any rows were extracted
+            if all_note_data.get("type"):
                 print("\n--- Converting to DataFrame ---")
 
                 #  Extract data